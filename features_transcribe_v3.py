@@ -1,12 +1,20 @@
-import moviepy as mp
-import speech_recognition as sr
 from pathlib import Path
 import argparse
-from PIL import Image, ImageDraw, ImageFont
-import numpy as np
-import textwrap
+import collections
+import contextlib
+import importlib
 import json
+import os
 import re
+import socketserver
+import stat
+import sys
+
+# moviepy, speech_recognition, PIL and numpy are imported inside the stages
+# that use them so that --help and other light paths start quickly.
+
+_font_cache = {}
+_recognizer = None
 
 def load_transcription(input_path):
     """Load transcription data from a JSON file"""
@@ -50,18 +58,39 @@ def parse_text_with_emphasis(text):
     
     return segments
 
+def load_fonts(font_settings):
+    """Load regular and bold fonts, reusing previously loaded ones"""
+    from PIL import ImageFont
+
+    key = (font_settings['font_path'], font_settings['bold_font_path'], font_settings['font_size'])
+    if key not in _font_cache:
+        try:
+            regular_font = ImageFont.truetype(font_settings['font_path'], font_settings['font_size'])
+            bold_font = ImageFont.truetype(font_settings['bold_font_path'], font_settings['font_size'])
+        except:
+            print("Could not load custom fonts, using default")
+            regular_font = bold_font = ImageFont.load_default()
+        _font_cache[key] = (regular_font, bold_font)
+    return _font_cache[key]
+
+def get_recognizer():
+    """Return a shared speech recognizer, creating it on first use"""
+    global _recognizer
+    if _recognizer is None:
+        import speech_recognition as sr
+        _recognizer = sr.Recognizer()
+    return _recognizer
+
 def create_text_image(text_data, size, font_settings):
     """Create a PIL image with text in a bounded box, supporting emphasis"""
+    from PIL import Image, ImageDraw
+    import numpy as np
+
     img = Image.new('RGBA', size, (0, 0, 0, 0))
     draw = ImageDraw.Draw(img)
     
     # Load regular and bold fonts
-    try:
-        regular_font = ImageFont.truetype(font_settings['font_path'], font_settings['font_size'])
-        bold_font = ImageFont.truetype(font_settings['bold_font_path'], font_settings['font_size'])
-    except:
-        print("Could not load custom fonts, using default")
-        regular_font = bold_font = ImageFont.load_default()
+    regular_font, bold_font = load_fonts(font_settings)
     
     # Parse text segments if it's a string, or use pre-parsed segments
     if isinstance(text_data, str):
@@ -135,6 +164,8 @@ def create_text_image(text_data, size, font_settings):
 
 def create_subtitle_clips(words_with_timestamps, video_size, font_settings):
     """Create subtitle clips from transcribed text with emphasis support"""
+    import moviepy as mp
+
     subtitle_clips = []
     
     for start, end, text in words_with_timestamps:
@@ -146,8 +177,169 @@ def create_subtitle_clips(words_with_timestamps, video_size, font_settings):
     
     return subtitle_clips
 
-def process_video(video_path, font_settings, generate_transcription=True, output_path=None):
+def subtitle_frame_bytes(video_size):
+    """Bytes held for one cached subtitle frame: RGB bitmap plus float32 mask"""
+    return video_size[0] * video_size[1] * (3 + 4)
+
+def check_memory_budget(budget_bytes, video_size):
+    """Raise ValueError if the budget cannot hold one subtitle frame"""
+    frame_bytes = subtitle_frame_bytes(video_size)
+    if budget_bytes < frame_bytes:
+        raise ValueError(f"Memory budget of {budget_bytes} bytes is smaller than "
+                         f"one subtitle frame ({frame_bytes} bytes)")
+
+class SubtitleBitmapCache:
+    """Render subtitle frames on demand, holding at most budget_bytes of them"""
+    def __init__(self, words_with_timestamps, video_size, font_settings, budget_bytes):
+        check_memory_budget(budget_bytes, video_size)
+        self.segments = sorted((float(start), float(end), text)
+                               for start, end, text in words_with_timestamps)
+        self.starts = [start for start, _, _ in self.segments]
+        # Sweep state: next segment to start and segments currently shown
+        self.next_idx = 0
+        self.active = []
+        self.sweep_t = None
+        # RGB and mask frames are requested at the same t, so reuse the lookup
+        self.last_t = None
+        self.last_frame = None
+        self.video_size = video_size
+        self.font_settings = font_settings
+        self.budget_bytes = budget_bytes
+        self.frames = collections.OrderedDict()
+        self.held_bytes = 0
+    
+    def spans(self):
+        """Return (start, end) time ranges during which any segment is shown"""
+        spans = []
+        for start, end, _ in self.segments:
+            if start >= end:
+                continue
+            if spans and start <= spans[-1][1]:
+                spans[-1][1] = max(spans[-1][1], end)
+            else:
+                spans.append([start, end])
+        return [tuple(span) for span in spans]
+    
+    def active_segments(self, t):
+        """Return the indices of the segments shown at time t, in start order"""
+        # Frames are requested in order, so sweep forward from the previous
+        # time; seeking backwards restarts the sweep
+        if self.sweep_t is not None and t < self.sweep_t:
+            self.next_idx = 0
+            self.active = []
+        self.sweep_t = t
+        while self.next_idx < len(self.segments) and self.starts[self.next_idx] <= t:
+            self.active.append(self.next_idx)
+            self.next_idx += 1
+        self.active = [idx for idx in self.active if self.segments[idx][1] > t]
+        return tuple(self.active)
+    
+    def release(self, key):
+        rgb, mask = self.frames.pop(key)
+        self.held_bytes -= rgb.nbytes + mask.nbytes
+    
+    def render(self, key):
+        """Render the segments in key into an RGB bitmap and float32 mask"""
+        from PIL import Image
+        import numpy as np
+
+        # The RGBA scratch images below are freed on return and not counted
+        # toward the budget, only the returned frame is
+        rgba = create_text_image(self.segments[key[0]][2], self.video_size, self.font_settings)
+        # Overlapping segments are layered in start order, as CompositeVideoClip does
+        for idx in key[1:]:
+            overlay = create_text_image(self.segments[idx][2], self.video_size, self.font_settings)
+            rgba = np.array(Image.alpha_composite(Image.fromarray(rgba), Image.fromarray(overlay)))
+        rgb = np.ascontiguousarray(rgba[:, :, :3])
+        mask = rgba[:, :, 3].astype(np.float32) / 255
+        return rgb, mask
+    
+    def get(self, t):
+        """Return the (rgb, mask) frame shown at time t, or None between segments"""
+        if t == self.last_t:
+            return self.last_frame
+        self.last_t = t
+        self.last_frame = self.lookup(t)
+        return self.last_frame
+    
+    def lookup(self, t):
+        key = self.active_segments(t)
+        
+        # Release frames containing segments that have already ended
+        for held_key in [k for k in self.frames if min(self.segments[i][1] for i in k) <= t]:
+            self.release(held_key)
+        if not key:
+            return None
+        
+        if key in self.frames:
+            self.frames.move_to_end(key)
+            return self.frames[key]
+        
+        # Make room before rendering so held bytes never exceed the budget
+        frame_bytes = subtitle_frame_bytes(self.video_size)
+        while self.frames and self.held_bytes + frame_bytes > self.budget_bytes:
+            self.release(next(iter(self.frames)))
+        rgb, mask = self.render(key)
+        self.frames[key] = (rgb, mask)
+        self.held_bytes += rgb.nbytes + mask.nbytes
+        return rgb, mask
+
+def create_streaming_subtitle_clips(words_with_timestamps, video_size, font_settings, budget_bytes):
+    """Create subtitle overlays whose frames are rendered only while their segments are active"""
+    import moviepy as mp
+    import numpy as np
+
+    cache = SubtitleBitmapCache(words_with_timestamps, video_size, font_settings, budget_bytes)
+    # VideoClip reads a frame at construction to find its size; answer those
+    # with a blank so no subtitle is rendered before its segment plays
+    building = True
+    
+    def frame_at(t, channel):
+        frame = None if building else cache.get(t)
+        if frame is not None:
+            return frame[channel]
+        # Only reached at span edges and while building, so a transient blank is
+        # cheaper than keeping one
+        if channel == 0:
+            return np.zeros((video_size[1], video_size[0], 3), dtype=np.uint8)
+        return np.zeros((video_size[1], video_size[0]), dtype=np.float32)
+    
+    def make_span_clip(start, end):
+        # Clips only cover subtitled spans, so no frames are requested in between
+        mask = mp.VideoClip(frame_function=lambda t: frame_at(start + t, 1),
+                            is_mask=True, duration=end - start)
+        return (mp.VideoClip(frame_function=lambda t: frame_at(start + t, 0), duration=end - start)
+                .with_mask(mask)
+                .with_start(start))
+    
+    clips = [make_span_clip(start, end) for start, end in cache.spans()]
+    building = False
+    return clips
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB, or None if unsupported"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    if sys.platform != 'darwin':
+        peak *= 1024
+    return round(peak / (1024 * 1024), 1)
+
+def report_peak_memory():
+    """Print the peak resident set size of this process, where supported"""
+    peak = peak_rss_mb()
+    if peak is not None:
+        # A worker runs many jobs, so this is the peak across all of them so far
+        print(f"Process peak RSS: {peak:.1f} MB")
+
+def process_video(video_path, font_settings, generate_transcription=True, output_path=None,
+                  memory_budget=None):
     """Process video to add transcribed text overlay with emphasis support"""
+    import moviepy as mp
+
     video_file = Path(video_path)
     if output_path is None:
         output_path = video_file.with_suffix('.subtitled.mp4')
@@ -156,40 +348,167 @@ def process_video(video_path, font_settings, generate_transcription=True, output
     
     print(f"Processing {video_file.name}...")
     video = mp.VideoFileClip(str(video_file))
-    
-    if generate_transcription:
-        print("Generating new transcription...")
-        recognizer = sr.Recognizer()
-        words_with_timestamps = transcribe_with_timestamps(recognizer, video.audio)
-        save_transcription(words_with_timestamps, transcription_path)
-    else:
-        print("Loading existing transcription...")
-        if not transcription_path.exists():
-            raise FileNotFoundError(f"Transcription file not found: {transcription_path}")
-        words_with_timestamps = load_transcription(transcription_path)
-    
-    print("Creating subtitle clips...")
-    subtitle_clips = create_subtitle_clips(words_with_timestamps, video.size, font_settings)
-    
-    print("Adding subtitles to video...")
-    final_video = mp.CompositeVideoClip([video] + subtitle_clips)
-    
-    print(f"Writing output to {output_path}...")
-    final_video.write_videofile(str(output_path), 
-                              codec='libx264',
-                              audio_codec='aac')
-    
-    video.close()
-    final_video.close()
+    final_video = None
+    try:
+        # Check the budget before the slow transcription step
+        if memory_budget is not None:
+            check_memory_budget(int(memory_budget * 1024 * 1024), video.size)
+        
+        if generate_transcription:
+            print("Generating new transcription...")
+            recognizer = get_recognizer()
+            words_with_timestamps = transcribe_with_timestamps(recognizer, video.audio)
+            save_transcription(words_with_timestamps, transcription_path)
+        else:
+            print("Loading existing transcription...")
+            if not transcription_path.exists():
+                raise FileNotFoundError(f"Transcription file not found: {transcription_path}")
+            words_with_timestamps = load_transcription(transcription_path)
+        
+        if memory_budget is None:
+            print("Creating subtitle clips...")
+            subtitle_clips = create_subtitle_clips(words_with_timestamps, video.size, font_settings)
+        else:
+            print(f"Streaming subtitle clips within {memory_budget} MB...")
+            subtitle_clips = create_streaming_subtitle_clips(words_with_timestamps, video.size,
+                                                             font_settings,
+                                                             int(memory_budget * 1024 * 1024))
+        
+        print("Adding subtitles to video...")
+        final_video = mp.CompositeVideoClip([video] + subtitle_clips)
+        
+        print(f"Writing output to {output_path}...")
+        final_video.write_videofile(str(output_path), 
+                                  codec='libx264',
+                                  audio_codec='aac')
+    finally:
+        # Close clips on failure too, a worker keeps running after a failed job
+        video.close()
+        if final_video is not None:
+            final_video.close()
+        report_peak_memory()
     print("Done!")
+    return output_path
+
+def positive_megabytes(value):
+    """Argparse type for a positive number of megabytes"""
+    try:
+        megabytes = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number of megabytes: {value!r}")
+    if megabytes <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive number of megabytes: {value!r}")
+    return megabytes
+
+def build_font_settings(args):
+    """Build the font settings dictionary from parsed arguments"""
+    return {
+        'font_path': args.font_path,
+        'bold_font_path': args.bold_font_path,
+        'font_size': args.font_size,
+        'font_color': parse_color(args.font_color),
+        'outline_color': parse_color(args.outline_color),
+        'outline_width': args.outline_width,
+        'line_spacing': args.line_spacing,
+        'bottom_padding': args.bottom_padding,
+        'width_percent': args.width_percent
+    }
+
+def warm_up(font_settings):
+    """Import heavy modules, load fonts and create the recognizer ahead of the first worker job"""
+    for module_name in ('moviepy', 'numpy', 'PIL.Image', 'PIL.ImageDraw'):
+        importlib.import_module(module_name)
+    load_fonts(font_settings)
+    get_recognizer()
+
+def handle_job(line, font_settings, memory_budget=None):
+    """Run one JSON job line and return a JSON result line"""
+    try:
+        job = json.loads(line)
+        settings = dict(font_settings)
+        for key, value in job.get('font_settings', {}).items():
+            if key in ('font_color', 'outline_color') and isinstance(value, str):
+                value = parse_color(value)
+            settings[key] = value
+        job_budget = job.get('memory_budget', memory_budget)
+        if job_budget is not None and (isinstance(job_budget, bool)
+                                       or not isinstance(job_budget, (int, float))
+                                       or job_budget <= 0):
+            raise ValueError(f"memory_budget must be a positive number of megabytes, got {job_budget!r}")
+        # Keep progress output off stdout, which carries the protocol
+        with contextlib.redirect_stdout(sys.stderr):
+            output_path = process_video(job['video_path'], settings,
+                                        generate_transcription=job.get('generate_transcription', False),
+                                        output_path=job.get('output'),
+                                        memory_budget=job_budget)
+        result = {'ok': True, 'output': str(output_path)}
+    except Exception as e:
+        result = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+    result['process_peak_rss_mb'] = peak_rss_mb()
+    return json.dumps(result)
+
+class WorkerHandler(socketserver.StreamRequestHandler):
+    """Handle newline-delimited JSON jobs from one socket connection"""
+    def handle(self):
+        for raw_line in self.rfile:
+            line = raw_line.decode('utf-8').strip()
+            if line:
+                result = handle_job(line, self.server.font_settings,
+                                    self.server.memory_budget)
+                self.wfile.write((result + '\n').encode('utf-8'))
+                self.wfile.flush()
+
+def run_worker(font_settings, socket_path=None, memory_budget=None):
+    """Serve process_video jobs one after another until stopped"""
+    if socket_path is None:
+        # Only result lines may reach stdout, which carries the protocol
+        protocol_out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            warm_up(font_settings)
+            print("Worker ready, reading jobs from stdin")
+            for line in sys.stdin:
+                line = line.strip()
+                if line:
+                    print(handle_job(line, font_settings, memory_budget),
+                          file=protocol_out, flush=True)
+        return
+    
+    warm_up(font_settings)
+    # Only replace a stale socket, never an ordinary file at that path
+    if os.path.exists(socket_path):
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            raise FileExistsError(f"Socket path exists and is not a socket: {socket_path}")
+        os.unlink(socket_path)
+    with socketserver.UnixStreamServer(socket_path, WorkerHandler) as server:
+        server.font_settings = font_settings
+        server.memory_budget = memory_budget
+        print(f"Worker listening on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
 
 def main():
     parser = argparse.ArgumentParser(description='Add transcribed text overlay to video with emphasis support')
-    parser.add_argument('video_path', help='Path to the video file')
+    parser.add_argument('video_path', nargs='?', help='Path to the video file')
     parser.add_argument('--output', help='Output path (optional)')
     parser.add_argument('--generate-transcription', action='store_true',
                       help='Generate new transcription (if false, will use existing transcription file)')
     
+    parser.add_argument('--memory-budget', type=positive_megabytes, metavar='MB',
+                      help='Render subtitles lazily while they are on screen, holding at most this many '
+                           'megabytes of cached subtitle frames (RGB bitmap plus mask, '
+                           '7 bytes per pixel each); scratch images used while drawing '
+                           'one subtitle are not counted')
+    
+    # Worker mode arguments
+    parser.add_argument('--worker', action='store_true',
+                      help='Run as a long-lived worker taking JSON jobs (one per line) on stdin')
+    parser.add_argument('--socket', dest='socket_path',
+                      help='With --worker, serve jobs on this Unix socket instead of stdin')
+    
     # Font customization arguments
     parser.add_argument('--font-path', default="/Library/Fonts/Arial.ttf",
                       help='Path to regular font file (TTF format)')
@@ -211,22 +530,19 @@ def main():
                       help='Width of text box as percentage of video width (0.0-1.0)')
     
     args = parser.parse_args()
-
-    font_settings = {
-        'font_path': args.font_path,
-        'bold_font_path': args.bold_font_path,
-        'font_size': args.font_size,
-        'font_color': parse_color(args.font_color),
-        'outline_color': parse_color(args.outline_color),
-        'outline_width': args.outline_width,
-        'line_spacing': args.line_spacing,
-        'bottom_padding': args.bottom_padding,
-        'width_percent': args.width_percent
-    }
+    font_settings = build_font_settings(args)
+    
+    if args.worker:
+        run_worker(font_settings, socket_path=args.socket_path,
+                   memory_budget=args.memory_budget)
+        return
+    if args.video_path is None:
+        parser.error('video_path is required unless --worker is given')
     
     process_video(args.video_path, font_settings, 
                  generate_transcription=args.generate_transcription,
-                 output_path=args.output)
+                 output_path=args.output,
+                 memory_budget=args.memory_budget)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,129 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+mp = pytest.importorskip("moviepy")
+
+import features_transcribe_v3 as ft
+
+VIDEO_SIZE = (160, 120)
+FRAME_BYTES = ft.subtitle_frame_bytes(VIDEO_SIZE)
+
+FONT_SETTINGS = {
+    'font_path': 'missing.ttf',
+    'bold_font_path': 'missing-bold.ttf',
+    'font_size': 12,
+    'font_color': (255, 255, 0),
+    'outline_color': (0, 0, 0),
+    'outline_width': 1,
+    'line_spacing': 4,
+    'bottom_padding': 10,
+    'width_percent': 0.8
+}
+
+# Overlapping segments, a gap, and segments that abut
+SEGMENTS = [
+    (0.0, 2.0, 'first line'),
+    (1.0, 3.0, '*second* line'),
+    (1.5, 2.5, 'third'),
+    (4.0, 5.0, 'after a gap'),
+    (5.0, 6.0, 'abutting'),
+]
+
+def sweep_times(end, step=0.25):
+    return [i * step for i in range(int(end / step) + 1)]
+
+def track_renders(cache):
+    """Record each rendered key and the bytes held when rendering started"""
+    renders = []
+    render = cache.render
+
+    def tracking_render(key):
+        renders.append((key, cache.held_bytes))
+        return render(key)
+
+    cache.render = tracking_render
+    return renders
+
+@pytest.mark.parametrize('frames', [1, 2, 3])
+def test_held_bytes_never_exceed_budget(frames):
+    budget = frames * FRAME_BYTES
+    cache = ft.SubtitleBitmapCache(SEGMENTS, VIDEO_SIZE, FONT_SETTINGS, budget)
+    renders = track_renders(cache)
+
+    for t in sweep_times(7):
+        cache.get(t)
+        assert cache.held_bytes <= budget
+
+    assert renders
+    for _, held_bytes in renders:
+        assert held_bytes + FRAME_BYTES <= budget
+
+def test_overlapping_segments_share_one_frame():
+    cache = ft.SubtitleBitmapCache(SEGMENTS, VIDEO_SIZE, FONT_SETTINGS, 10 * FRAME_BYTES)
+
+    assert cache.active_segments(0.5) == (0,)
+    assert cache.active_segments(1.75) == (0, 1, 2)
+    assert cache.active_segments(2.75) == (1,)
+    assert cache.active_segments(3.5) == ()
+    assert cache.active_segments(5.0) == (4,)
+    # Seeking backwards restarts the sweep
+    assert cache.active_segments(1.25) == (0, 1)
+    assert cache.spans() == [(0.0, 3.0), (4.0, 6.0)]
+
+def test_frames_released_when_segment_ends():
+    cache = ft.SubtitleBitmapCache(SEGMENTS, VIDEO_SIZE, FONT_SETTINGS, 10 * FRAME_BYTES)
+
+    cache.get(0.5)
+    cache.get(1.25)
+    assert list(cache.frames) == [(0,), (0, 1)]
+    cache.get(2.75)
+    assert list(cache.frames) == [(1,)]
+    assert cache.get(3.5) is None
+    assert not cache.frames
+    assert cache.held_bytes == 0
+
+def test_least_recently_used_frame_evicted_first():
+    segments = [(0.0, 10.0, 'a'), (1.0, 10.0, 'b'), (2.0, 10.0, 'c')]
+    cache = ft.SubtitleBitmapCache(segments, VIDEO_SIZE, FONT_SETTINGS, 2 * FRAME_BYTES)
+
+    cache.get(0.5)
+    cache.get(1.5)
+    cache.get(2.5)
+    assert list(cache.frames) == [(0, 1), (0, 1, 2)]
+    assert cache.held_bytes == 2 * FRAME_BYTES
+
+def test_budget_smaller_than_one_frame_rejected():
+    with pytest.raises(ValueError):
+        ft.SubtitleBitmapCache(SEGMENTS, VIDEO_SIZE, FONT_SETTINGS, FRAME_BYTES - 1)
+
+def test_streaming_clips_render_nothing_until_played():
+    renders = []
+    render = ft.SubtitleBitmapCache.render
+
+    def tracking_render(cache, key):
+        renders.append(key)
+        return render(cache, key)
+
+    ft.SubtitleBitmapCache.render = tracking_render
+    try:
+        clips = ft.create_streaming_subtitle_clips(SEGMENTS, VIDEO_SIZE, FONT_SETTINGS,
+                                                   2 * FRAME_BYTES)
+    finally:
+        ft.SubtitleBitmapCache.render = render
+
+    assert len(clips) == 2
+    assert renders == []
+
+def test_streaming_matches_subtitle_clips():
+    background = mp.ColorClip(VIDEO_SIZE, color=(0, 0, 255), duration=7)
+    expected = mp.CompositeVideoClip(
+        [background] + ft.create_subtitle_clips(SEGMENTS, VIDEO_SIZE, FONT_SETTINGS))
+    streamed = mp.CompositeVideoClip(
+        [background] + ft.create_streaming_subtitle_clips(SEGMENTS, VIDEO_SIZE, FONT_SETTINGS,
+                                                          FRAME_BYTES))
+
+    for t in sweep_times(6.75):
+        expected_frame = expected.get_frame(t).astype(int)
+        streamed_frame = streamed.get_frame(t).astype(int)
+        assert np.abs(expected_frame - streamed_frame).max() <= 1, f"frames differ at t={t}"